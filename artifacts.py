@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CHECK_INTERVAL = 5  # Seconds between checks of the watched files
+
+
+class Artifact:
+    def __init__(self, name, paths, loader, swap):
+        self.name = name
+        self.paths = paths      # Files the index is built from
+        self.loader = loader    # Builds the new index: loader(current index) -> index
+        self.swap = swap        # Makes an index live: swap(index)
+        self.value = None
+        self.version = 1
+        self.loaded_at = time.time()
+        self.mtimes = self._mtimes()
+        self.pending_mtimes = None  # Changed modification times waiting for the next check
+        self.building = False
+
+    def _mtimes(self):
+        return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in self.paths)
+
+
+class ArtifactManager:
+    """
+    Watches the data files behind the in-memory indexes. When a file changes, the index is rebuilt
+    in the background and swapped in with a single assignment; requests that already hold the old
+    index finish on it.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.artifacts = {}
+        self._lock = threading.Lock()
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-builder")
+        self._watcher = None
+        self._stopped = threading.Event()
+
+    def register(self, name, paths, loader, swap, value=None):
+        """Watch paths and rebuild the index called name with loader when they change."""
+        artifact = Artifact(name, paths, loader, swap)
+        artifact.value = value
+        self.artifacts[name] = artifact
+
+    def start(self):
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._builder.shutdown(wait=False)
+
+    def _watch(self):
+        while not self._stopped.wait(self.check_interval):
+            self.check()
+
+    def check(self):
+        """Start a rebuild for every artifact whose files changed and have settled since the last check."""
+        for artifact in self.artifacts.values():
+            mtimes = artifact._mtimes()
+            with self._lock:
+                if mtimes == artifact.mtimes or artifact.building:
+                    continue
+                # A file still being written changes between checks, wait until it is stable
+                if mtimes != artifact.pending_mtimes:
+                    artifact.pending_mtimes = mtimes
+                    continue
+                artifact.building = True
+            self._builder.submit(self._rebuild, artifact, mtimes)
+
+    def _rebuild(self, artifact, mtimes):
+        start = time.perf_counter()
+        try:
+            value = artifact.loader(artifact.value)
+        except Exception as e:
+            print(f"Reloading {artifact.name} failed, version {artifact.version} stays live: {e}")
+            with self._lock:
+                artifact.mtimes = mtimes     # Do not retry until the files change again
+                artifact.building = False
+            return
+
+        with self._lock:
+            artifact.swap(value)
+            artifact.value = value
+            artifact.version += 1
+            artifact.loaded_at = time.time()
+            artifact.mtimes = mtimes
+            artifact.building = False
+        print(f"Artifact {artifact.name} version {artifact.version} is live "
+              f"(built in {time.perf_counter() - start:.1f}s).")
+
+    def report(self):
+        """Live version of every artifact."""
+        with self._lock:
+            return {
+                name: {
+                    "version": artifact.version,
+                    "loaded_at": time.strftime("%H:%M:%S, %d-%m-%Y", time.localtime(artifact.loaded_at)),
+                    "building": artifact.building,
+                }
+                for name, artifact in self.artifacts.items()
+            }
@@ -0,0 +1,130 @@
+import csv
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Offline build steps and the files or directories each of them writes
+build_steps = {
+    'entities.py': ['entities.csv'],
+    'predicates.py': ['predicates.csv'],
+    'movieFeatures.py': ['movie_features.csv', 'movie_features'],
+}
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sizes = [int(size) for size in sys.argv[1:]] or [1000, 4000, 16000, 64000]  # Number of films per graph
+results_path = './build_benchmark.csv'
+superlinear_exponent = 1.3  # Growth exponents above this are reported
+
+WD = 'http://www.wikidata.org/entity/'
+WDT = 'http://www.wikidata.org/prop/direct/'
+LABEL = 'http://www.w3.org/2000/01/rdf-schema#label'
+DATE = 'http://www.w3.org/2001/XMLSchema#date'
+
+words = ['the', 'last', 'night', 'star', 'love', 'dark', 'city', 'king', 'story', 'man', 'girl', 'war',
+         'day', 'house', 'river', 'secret', 'blue', 'lost', 'return', 'dream', 'road', 'fire', 'heart']
+
+def zipf_choice(rng, items):
+    """Pick an item with a Zipf-like skew, a few directors or genres cover most films."""
+    return items[min(int(rng.paretovariate(1.2)) - 1, len(items) - 1)]
+
+def generate_graph(path, n_films, seed=0):
+    """Write a synthetic N-Triples graph with the shape of the movie graph."""
+    rng = random.Random(seed)
+    n_people = n_films // 2
+    people = [f'Q{1000000 + i}' for i in range(n_people)]
+    genres = [f'Q{2000000 + i}' for i in range(max(10, n_films // 500))]
+    publishers = [f'Q{3000000 + i}' for i in range(max(5, n_films // 200))]
+    predicate_labels = {'P57': 'director', 'P136': 'genre', 'P123': 'publisher', 'P577': 'publication date',
+                        'P31': 'instance of', 'P161': 'cast member', 'P345': 'IMDb ID'}
+
+    with open(path, 'w', encoding='utf-8') as file:
+        def label(entity, text):
+            file.write(f'<{WD}{entity}> <{LABEL}> "{text}"@en .\n')
+
+        for predicate, text in predicate_labels.items():
+            file.write(f'<{WDT}{predicate}> <{LABEL}> "{text}"@en .\n')
+        for i, person in enumerate(people):
+            label(person, f'Person {i} {rng.choice(words).title()}')
+            file.write(f'<{WD}{person}> <{WDT}P345> "nm{i:07d}" .\n')
+        for i, genre in enumerate(genres):
+            label(genre, f'genre {i}')
+        for i, publisher in enumerate(publishers):
+            label(publisher, f'Publisher {i}')
+
+        for i in range(n_films):
+            film = f'Q{i + 1}'
+            title = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 4))).title()
+            label(film, f'{title} {i}')
+            file.write(f'<{WD}{film}> <{WDT}P31> <{WD}Q11424> .\n')
+            file.write(f'<{WD}{film}> <{WDT}P57> <{WD}{zipf_choice(rng, people)}> .\n')
+            for genre in {zipf_choice(rng, genres) for _ in range(rng.randint(1, 3))}:
+                file.write(f'<{WD}{film}> <{WDT}P136> <{WD}{genre}> .\n')
+            if rng.random() < 0.6:
+                file.write(f'<{WD}{film}> <{WDT}P123> <{WD}{zipf_choice(rng, publishers)}> .\n')
+            date = f'{rng.randint(1920, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+            file.write(f'<{WD}{film}> <{WDT}P577> "{date}"^^<{DATE}> .\n')
+            for person in rng.sample(people, min(len(people), rng.randint(2, 8))):
+                file.write(f'<{WD}{film}> <{WDT}P161> <{WD}{person}> .\n')
+
+def output_size(path):
+    """Size of a file, or of all files in a directory, in MB."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / (1024 * 1024)
+
+def run_step(script, workdir):
+    """Run a build script in workdir, returns wall time in seconds and peak RSS in MB."""
+    log_path = os.path.join(workdir, f'{script}.log')
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(script_dir, script)], cwd=workdir,
+                                   stdout=log, stderr=log)
+        # wait4 returns the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        with open(log_path, 'r') as log:
+            raise RuntimeError(f"{script} failed:\n{log.read()}")
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, peak_rss
+
+# Run every build step on graphs of increasing size
+results = []
+for n_films in sizes:
+    with tempfile.TemporaryDirectory() as workdir:
+        graph_path = os.path.join(workdir, '14_graph.nt')
+        generate_graph(graph_path, n_films)
+        with open(graph_path, 'r', encoding='utf-8') as file:
+            n_triples = sum(1 for _ in file)
+
+        for script, outputs in build_steps.items():
+            elapsed, peak_rss = run_step(script, workdir)
+            output_mb = sum(output_size(os.path.join(workdir, output)) for output in outputs)
+            results.append({'step': script, 'films': n_films, 'triples': n_triples, 'seconds': round(elapsed, 3),
+                             'peak_rss_mb': round(peak_rss, 1), 'output_mb': round(output_mb, 3)})
+            print(f"{script:<18} {n_triples:>9} triples  {elapsed:8.2f}s  {peak_rss:8.1f} MB RSS  "
+                  f"{output_mb:8.3f} MB output")
+
+with open(results_path, mode='w', newline='', encoding='utf-8') as file:
+    writer = csv.DictWriter(file, fieldnames=list(results[0].keys()))
+    writer.writeheader()
+    writer.writerows(results)
+
+# Growth exponent between consecutive sizes: 1 is linear, 2 is quadratic
+for script in build_steps:
+    runs = [result for result in results if result['step'] == script]
+    for previous, current in zip(runs, runs[1:]):
+        size_ratio = math.log(current['triples'] / previous['triples'])
+        for metric in ('seconds', 'peak_rss_mb'):
+            if previous[metric] > 0 and current[metric] > 0:
+                exponent = math.log(current[metric] / previous[metric]) / size_ratio
+                if exponent > superlinear_exponent:
+                    print(f"{script}: {metric} grows super-linearly between {previous['triples']} and "
+                          f"{current['triples']} triples (exponent {exponent:.2f})")
+
+print(f"Benchmark results have been written to {results_path}.")
@@ -1,7 +1,7 @@
 from speakeasypy import Speakeasy, Chatroom
 from typing import List
 import time
-from rdflib import Graph
+from sparql_service import SparqlService
 
 DEFAULT_HOST_URL = 'https://speakeasy.ifi.uzh.ch'
 listen_freq = 2
@@ -13,8 +13,9 @@ class Agent:
         self.speakeasy = Speakeasy(host=DEFAULT_HOST_URL, username=username, password=password)
         self.speakeasy.login()  # This framework will help you log out automatically when the program terminates.
 
-        self.graph = Graph()
-        self.graph.parse('./14_graph.nt', format='turtle')
+        # Queries run in a separate worker process with a time limit and a cap on result rows.
+        self.sparql = SparqlService('./14_graph.nt')
+        self.sparql.wait_ready()  # Load the graph before serving the first message
 
     def listen(self):
         while True:
@@ -68,7 +69,10 @@ class Agent:
         return time.strftime("%H:%M:%S, %d-%m-%Y", time.localtime())
 
     def execute_sparql(self, query: str):
-        return self.graph.query(query)
+        result = self.sparql.execute(query)
+        print(f"\t- SPARQL query executed in {result.elapsed:.3f}s ({len(result)} rows, "
+              f"{'cached' if result.cached else 'new'} plan)")
+        return result
     
     def format_results(self, results):
         if not results:
@@ -76,6 +80,8 @@ class Agent:
         formatted_results = []
         for result in results:
             formatted_results.append(str(result[0]))
+        if results.truncated:
+            formatted_results.append(f"(Only the first {len(results)} results are shown.)")
         return "\n".join(formatted_results)
 
 if __name__ == '__main__':
@@ -2,12 +2,17 @@ from speakeasypy import Speakeasy, Chatroom
 from typing import List
 import time
 import process_v2
+import deadline
+from profiler_hook import ProfilerHook
+from job_queue import JobQueue
+from artifacts import ArtifactManager
 import requests
 from PIL import Image
 from io import BytesIO
 
 DEFAULT_HOST_URL = 'https://speakeasy.ifi.uzh.ch'
 listen_freq = 2
+latency_budget = {"fast": 10, "slow": 60}  # Seconds per message, counted from its arrival
 
 class Agent:
     def __init__(self, username, password):
@@ -16,8 +21,21 @@ class Agent:
         self.speakeasy = Speakeasy(host=DEFAULT_HOST_URL, username=username, password=password)
         self.speakeasy.login()  # This framework will help you log out automatically when the program terminates.
 
+        # Profiling is switched on at runtime with SIGUSR1 or the ./profile.request control file.
+        self.profiler = ProfilerHook()
+        # Questions are answered in the background, slow question types on their own lane.
+        self.jobs = JobQueue()
+        # Data files are watched and their indexes swapped in without a restart.
+        self.artifacts = ArtifactManager()
+        process_v2.register_artifacts(self.artifacts)
+        self.artifacts.start()
+
     def listen(self):
         while True:
+            try:
+                self.profiler.poll()
+            except Exception as e:  # Profiling must never stop serving
+                print(f"Profiler poll failed: {e}")
             # only check active chatrooms (i.e., remaining_time > 0) if active=True.
             rooms: List[Chatroom] = self.speakeasy.get_rooms(active=True)
             for room in rooms:
@@ -35,33 +53,22 @@ class Agent:
                         f"- {self.get_time()}")
 
                     # Implement your agent here #
-                    try:
-                        query = message.message
-                        
-                        multi_medias = ["picture", "look like", "looks like", "photo"]
-                        if any(multi_media in query.lower() for multi_media in multi_medias):
-                            room.post_messages("Processing your request, please wait about 30 seconds...")
+                    query = message.message
+                    category = process_v2.questionCategory(query)
+                    if category == "multi_media":
+                        room.post_messages("Processing your request, please wait about 30 seconds...")
 
-                        questionType, result = process_v2.handleQuestion(query) 
-                        if questionType == "factual":   # Factual question
-                            response = self.format_results(result)
-                        elif questionType == "embedding":   # Embedding question                                             
-                            response = "Embedding Answer: " + result
-                        elif questionType == "recommendation":  # Recommendation question
-                            response = "Adequate recommendations will be " + result + "."
-                        elif questionType == "multi_media": # Multi-media question
-                            response = f"image:{result}"
-                        elif questionType == "crowd_sourcing":  # Crowd-sourcing question
-                            response = result
+                    # The answer is posted to the room when the job finishes.
+                    lane = "slow" if category in ("multi_media", "recommendation") else "fast"
+                    budget = deadline.Budget(latency_budget[lane])
+                    if not self.jobs.submit(lane, lambda query=query, budget=budget: self.answer(query, budget), room):
+                        # Shed the question, answer from the cache if possible
+                        deadline.record(f"shed_{lane}")
+                        questionType, result = process_v2.cachedAnswer(query)
+                        if questionType:
+                            room.post_messages(self.format_response(questionType, result))
                         else:
-                            response = "No result found."
-
-                    except Exception as e:
-                        response = f"Error processing query: {str(e)}"
-
-                    # Send a message to the corresponding chat room using the post_messages method of the room object.
-                    # room.post_messages(f"Received your message: '{message.message}' ")
-                    room.post_messages(f"{response}")
+                            room.post_messages("I am busy right now, please ask again in a moment.")
                     # Mark the message as processed, so it will be filtered out when retrieving new messages.
                     room.mark_as_processed(message)
 
@@ -78,7 +85,29 @@ class Agent:
                     room.post_messages(f"Received your reaction: '{reaction.type}' ")
                     room.mark_as_processed(reaction)
 
-            time.sleep(listen_freq)
+            # Deliver finished answers while waiting for the next poll.
+            self.jobs.deliver(listen_freq)
+
+    def answer(self, query, budget=None):
+        questionType, result = self.profiler.profile(process_v2.handleQuestion, query, budget)
+        return self.format_response(questionType, result)
+
+    def format_response(self, questionType, result):
+        if questionType == "factual":   # Factual question
+            response = self.format_results(result)
+        elif questionType == "embedding":   # Embedding question                                             
+            response = "Embedding Answer: " + result
+        elif questionType == "recommendation":  # Recommendation question
+            response = "Adequate recommendations will be " + result + "."
+        elif questionType == "multi_media": # Multi-media question
+            response = f"image:{result}"
+        elif questionType == "crowd_sourcing":  # Crowd-sourcing question
+            response = result
+        elif questionType == "timed_out":   # Ran out of its latency budget
+            response = "This is taking too long right now, please ask again in a moment."
+        else:
+            response = "No result found."
+        return response
 
     @staticmethod
     def get_time():
@@ -0,0 +1,307 @@
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+FINGERPRINT_BYTES = 1024  # Bytes before the read offset compared to detect a replaced file
+
+def build_crowd_tables(data):
+    """
+    Compute per-task vote distributions, per-batch Fleiss' kappa and per-worker statistics
+    for a (filtered) crowd data frame in one vectorized pass.
+    Returns a dict with the "tasks", "batches" and "workers" tables.
+    """
+    # Encode tasks, workers and answers as integer codes
+    task_codes, task_ids = pd.factorize(data["HITId"], sort=True)
+    worker_codes, worker_ids = pd.factorize(data["WorkerId"], sort=True)
+    votes = (data["AnswerLabel"].to_numpy() == "CORRECT").astype(np.int64)
+    n_tasks = len(task_ids)
+
+    # Vote counts per task: column 0 is INCORRECT, column 1 is CORRECT
+    counts = np.bincount(task_codes * 2 + votes, minlength=n_tasks * 2).reshape(n_tasks, 2)
+
+    # Task attributes are constant within a HIT, take them from its first row
+    first_rows = np.unique(task_codes, return_index=True)[1]
+    firsts = data.iloc[first_rows]
+    tasks = pd.DataFrame({
+        "HITId": task_ids,
+        "HITTypeId": firsts["HITTypeId"].to_numpy(),
+        "Input1ID": firsts["Input1ID"].to_numpy(),
+        "Input2ID": firsts["Input2ID"].to_numpy(),
+        "Input3ID": firsts["Input3ID"].astype(str).to_numpy(),
+        "support": counts[:, 1],
+        "reject": counts[:, 0],
+    })
+    tasks["majority"] = np.where(counts[:, 1] > counts[:, 0], "CORRECT", "INCORRECT")
+
+    batches = fleiss_kappa_by_batch(tasks["HITTypeId"].to_numpy(), counts)
+
+    # Per-worker statistics, agreement is measured against the task majority
+    agrees = votes == (counts[task_codes, 1] > counts[task_codes, 0])
+    n_answers = np.bincount(worker_codes, minlength=len(worker_ids))
+    workers = pd.DataFrame({
+        "WorkerId": worker_ids,
+        "answers": n_answers,
+        "correct_votes": np.bincount(worker_codes, weights=votes, minlength=len(worker_ids)).astype(np.int64),
+        "majority_agreement": np.bincount(worker_codes, weights=agrees, minlength=len(worker_ids)) / n_answers,
+        "mean_work_time": np.bincount(worker_codes, weights=data["WorkTimeInSeconds"].to_numpy(dtype=float),
+                                      minlength=len(worker_ids)) / n_answers,
+    })
+
+    return {"tasks": tasks, "batches": batches, "workers": workers}
+
+def fleiss_kappa_by_batch(batch_ids, counts):
+    """
+    Fleiss' kappa for every batch, given the batch id of each task and its category counts,
+    with the category totals and mean observed agreement it is computed from.
+    Tasks may have different numbers of raters; tasks with fewer than two raters are skipped.
+    """
+    batch_codes, batch_names = pd.factorize(batch_ids, sort=True)
+    n_batches = len(batch_names)
+
+    raters = counts.sum(axis=1)
+    rated = raters >= 2
+    # Agreement within each task
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_i = np.where(rated, ((counts ** 2).sum(axis=1) - raters) / (raters * (raters - 1)), 0.0)
+
+    n_items = np.bincount(batch_codes, weights=rated, minlength=n_batches)
+    p_bar = np.bincount(batch_codes, weights=p_i, minlength=n_batches) / np.maximum(n_items, 1)
+
+    # Category proportions within each batch
+    category_totals = np.stack([np.bincount(batch_codes, weights=counts[:, j] * rated, minlength=n_batches)
+                                for j in range(counts.shape[1])], axis=1)
+    totals = category_totals.sum(axis=1)
+    p_j = category_totals / np.maximum(totals, 1)[:, None]
+    p_e = (p_j ** 2).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kappa = np.where(1 - p_e > 0, (p_bar - p_e) / (1 - p_e), 0.0)
+
+    return pd.DataFrame({
+        "HITTypeId": batch_names,
+        "tasks": n_items.astype(np.int64),
+        "votes": totals.astype(np.int64),
+        "support": category_totals[:, 1].astype(np.int64),
+        "reject": category_totals[:, 0].astype(np.int64),
+        "agreement": p_bar,
+        "kappa": np.round(kappa, 3),
+    })
+
+class CrowdStore:
+    """
+    Append-only store of crowd answers that keeps the per-task vote counts, majorities,
+    batch agreement and worker statistics up to date in O(new rows) per ingestion.
+    All reads and each ingested chunk hold the same lock, so readers see a consistent snapshot.
+    """
+
+    def __init__(self, row_filter=None):
+        self.row_filter = row_filter    # Applied to every chunk of new rows, e.g. filter_malicious_workers
+        self.version = 0
+        self._lock = threading.Lock()
+        self._tasks = {}    # {HITId: task attributes, vote counts and voters}
+        self._pairs = {}    # {(Input1ID, Input2ID): [HITId, ...]}
+        self._batches = {}  # {HITTypeId: Fleiss' kappa sufficient statistics}
+        self._workers = {}  # {WorkerId: answer statistics}
+        self._seen = set()  # AssignmentIds already ingested
+        self._files = {}    # {path: offset consumed so far, header, inode and fingerprint of the file}
+        self._file_lock = threading.Lock()  # Serializes tailing, e.g. a question and the artifact manager
+
+    def ingest(self, rows):
+        """
+        Filter and add new answer rows, returns the number of accepted rows.
+        The first rows of an empty store are loaded in one vectorized pass, later rows one by one.
+        """
+        if self.row_filter is not None:
+            rows = self.row_filter(rows.copy())
+
+        with self._lock:
+            if not self._seen:
+                accepted = self._seed(rows)
+            else:
+                accepted = 0
+                for row in rows.itertuples(index=False):
+                    if row.AssignmentId in self._seen:
+                        continue
+                    self._seen.add(row.AssignmentId)
+                    self._add_vote(row)
+                    accepted += 1
+            if accepted:
+                self.version += 1
+        return accepted
+
+    def ingest_file(self, path):
+        """
+        Ingest the complete rows appended to a TSV file since the last call.
+        Returns None if the file was replaced rather than appended to.
+        """
+        path = os.path.abspath(path)
+        with self._file_lock:
+            stat = os.stat(path)
+            consumed = self._files.get(path)
+            offset = consumed["offset"] if consumed else 0
+            if stat.st_size < offset:
+                return None
+
+            with open(path, 'rb') as file:
+                if consumed:
+                    # Still the same file: same inode, same header and the bytes read last are unchanged
+                    fingerprint = consumed["fingerprint"]
+                    file.seek(offset - len(fingerprint))
+                    if stat.st_ino != consumed["inode"] or file.read(len(fingerprint)) != fingerprint:
+                        return None
+                    file.seek(0)
+                    if file.read(len(consumed["header"])) != consumed["header"]:
+                        return None
+                if stat.st_size == offset:
+                    return 0
+                file.seek(offset)
+                data = file.read()
+
+            # The initial load takes the whole file, afterwards only complete lines are consumed.
+            # A last row without a line end is taken once it has all its fields and the file did
+            # not grow since the previous call, otherwise it is picked up next time
+            end = data.rfind(b'\n') + 1
+            if consumed is None:
+                end = len(data)
+                header = data.partition(b'\n')[0]
+                consumed = self._files[path] = {"header": header, "inode": stat.st_ino, "fingerprint": b''}
+            elif end < len(data) and consumed["pending"] == stat.st_size \
+                    and data[end:].count(b'\t') == consumed["header"].count(b'\t'):
+                end = len(data)
+            consumed["pending"] = stat.st_size if end < len(data) else None
+            if end == 0:
+                return 0
+            consumed["offset"] = offset + end
+            consumed["fingerprint"] = (consumed["fingerprint"] + data[:end])[-FINGERPRINT_BYTES:]
+
+            text = data[:end].decode('utf-8')
+            if offset == 0:
+                text = text.partition('\n')[2]
+            if not text.strip():
+                return 0
+            rows = pd.read_csv(io.StringIO(consumed["header"].decode('utf-8') + '\n' + text), sep="\t")
+            return self.ingest(rows)
+
+    def lookup(self, entity, relation):
+        """Answer, vote counts and batch agreement for the tasks about an (entity, relation) pair."""
+        with self._lock:
+            hit_ids = self._pairs.get((entity, relation))
+            if not hit_ids:
+                return None
+            first = self._tasks[hit_ids[0]]
+            return {
+                "answer": first["Input3ID"],
+                "support": sum(self._tasks[hit_id]["counts"][1] for hit_id in hit_ids),
+                "reject": sum(self._tasks[hit_id]["counts"][0] for hit_id in hit_ids),
+                "kappa": self._kappa(self._batches[first["HITTypeId"]]),
+            }
+
+    def tables(self):
+        """Current state in the same layout as build_crowd_tables."""
+        with self._lock:
+            tasks = pd.DataFrame([
+                {"HITId": hit_id, "HITTypeId": task["HITTypeId"], "Input1ID": task["Input1ID"],
+                 "Input2ID": task["Input2ID"], "Input3ID": task["Input3ID"],
+                 "support": task["counts"][1], "reject": task["counts"][0],
+                 "majority": "CORRECT" if task["counts"][1] > task["counts"][0] else "INCORRECT"}
+                for hit_id, task in sorted(self._tasks.items())
+            ])
+            batches = pd.DataFrame([
+                {"HITTypeId": batch_id, "tasks": batch["items"], "votes": sum(batch["totals"]),
+                 "support": batch["totals"][1], "reject": batch["totals"][0],
+                 "agreement": batch["p_sum"] / batch["items"] if batch["items"] else 0.0,
+                 "kappa": self._kappa(batch)}
+                for batch_id, batch in sorted(self._batches.items())
+            ])
+            workers = pd.DataFrame([
+                {"WorkerId": worker_id, "answers": worker["answers"], "correct_votes": worker["correct_votes"],
+                 "majority_agreement": worker["agreements"] / worker["answers"],
+                 "mean_work_time": worker["work_time"] / worker["answers"]}
+                for worker_id, worker in sorted(self._workers.items())
+            ])
+        return {"tasks": tasks, "batches": batches, "workers": workers}
+
+    def _seed(self, rows):
+        # Load the statistics of an empty store from the tables of build_crowd_tables
+        rows = rows[~rows["AssignmentId"].duplicated()]
+        if rows.empty:
+            return 0
+        tables = build_crowd_tables(rows)
+
+        # Tasks in the order of their first row, as if the rows had been added one by one
+        tasks = tables["tasks"]
+        first_seen = pd.Index(pd.unique(rows["HITId"]))
+        tasks = tasks.iloc[np.argsort(first_seen.get_indexer(tasks["HITId"]), kind="stable")]
+        for task in tasks.itertuples(index=False):
+            self._tasks[task.HITId] = {"HITTypeId": task.HITTypeId, "Input1ID": task.Input1ID,
+                                       "Input2ID": task.Input2ID, "Input3ID": task.Input3ID,
+                                       "counts": [int(task.reject), int(task.support)], "voters": []}
+            self._pairs.setdefault((task.Input1ID, task.Input2ID), []).append(task.HITId)
+        votes = (rows["AnswerLabel"].to_numpy() == "CORRECT").astype(np.int64)
+        for hit_id, worker_id, vote in zip(rows["HITId"].tolist(), rows["WorkerId"].tolist(), votes.tolist()):
+            self._tasks[hit_id]["voters"].append((worker_id, vote))
+
+        for batch in tables["batches"].itertuples(index=False):
+            self._batches[batch.HITTypeId] = {"p_sum": batch.agreement * batch.tasks, "items": int(batch.tasks),
+                                              "totals": [int(batch.reject), int(batch.support)]}
+        for worker in tables["workers"].itertuples(index=False):
+            self._workers[worker.WorkerId] = {
+                "answers": int(worker.answers),
+                "correct_votes": int(worker.correct_votes),
+                "agreements": int(round(worker.majority_agreement * worker.answers)),
+                "work_time": worker.mean_work_time * worker.answers,
+            }
+        self._seen.update(rows["AssignmentId"].tolist())
+        return len(rows)
+
+    def _add_vote(self, row):
+        task = self._tasks.get(row.HITId)
+        if task is None:
+            task = {"HITTypeId": row.HITTypeId, "Input1ID": row.Input1ID, "Input2ID": row.Input2ID,
+                    "Input3ID": str(row.Input3ID), "counts": [0, 0], "voters": []}
+            self._tasks[row.HITId] = task
+            self._pairs.setdefault((row.Input1ID, row.Input2ID), []).append(row.HITId)
+
+        batch = self._batches.setdefault(row.HITTypeId, {"p_sum": 0.0, "items": 0, "totals": [0, 0]})
+        worker = self._workers.setdefault(row.WorkerId,
+                                          {"answers": 0, "correct_votes": 0, "agreements": 0, "work_time": 0.0})
+        vote = 1 if row.AnswerLabel == "CORRECT" else 0
+
+        # Replace the task's contribution to its batch agreement
+        self._update_batch(batch, task["counts"], -1)
+        old_majority = task["counts"][1] > task["counts"][0]
+        task["counts"][vote] += 1
+        new_majority = task["counts"][1] > task["counts"][0]
+        self._update_batch(batch, task["counts"], 1)
+
+        # Earlier voters of the task change their agreement when its majority flips
+        if old_majority != new_majority:
+            for voter, voter_vote in task["voters"]:
+                self._workers[voter]["agreements"] += 1 if voter_vote == new_majority else -1
+        task["voters"].append((row.WorkerId, vote))
+
+        worker["answers"] += 1
+        worker["correct_votes"] += vote
+        worker["agreements"] += int(vote == new_majority)
+        worker["work_time"] += float(row.WorkTimeInSeconds)
+
+    @staticmethod
+    def _update_batch(batch, counts, sign):
+        raters = sum(counts)
+        if raters < 2:
+            return
+        batch["p_sum"] += sign * (sum(count ** 2 for count in counts) - raters) / (raters * (raters - 1))
+        batch["items"] += sign
+        for j, count in enumerate(counts):
+            batch["totals"][j] += sign * count
+
+    @staticmethod
+    def _kappa(batch):
+        total = sum(batch["totals"])
+        if not batch["items"] or not total:
+            return 0.0
+        p_bar = batch["p_sum"] / batch["items"]
+        p_e = sum((count / total) ** 2 for count in batch["totals"])
+        return round((p_bar - p_e) / (1 - p_e), 3) if (1 - p_e) > 0 else 0.0
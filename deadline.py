@@ -0,0 +1,31 @@
+import threading
+import time
+from collections import Counter
+
+# Number of times each degradation happened, e.g. {"skipped_embedding": 3}
+degradations = Counter()
+_lock = threading.Lock()
+
+def record(name):
+    """Count a degradation."""
+    with _lock:
+        degradations[name] += 1
+
+def report():
+    with _lock:
+        return dict(degradations)
+
+class Budget:
+    """Latency budget of one message, started when the message arrives."""
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds  # None means no limit
+        self.start = time.monotonic()
+
+    def remaining(self):
+        if self.seconds is None:
+            return float('inf')
+        return self.seconds - (time.monotonic() - self.start)
+
+    def expired(self):
+        return self.remaining() <= 0
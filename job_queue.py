@@ -0,0 +1,66 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FAST_WORKERS = 1    # Factual, crowd-sourcing and embedding questions
+MAX_SLOW_JOBS = 2   # Multi-media and recommendation questions running at the same time
+MAX_PENDING = {"fast": 20, "slow": 6}   # Queue depth per lane above which new questions are shed
+
+
+class JobQueue:
+    """
+    Runs questions in the background on two lanes, so fast questions never wait behind slow ones.
+    Finished jobs are collected and delivered to their rooms by the serving loop.
+    When a lane is too deep, new jobs are refused (admission control).
+    """
+
+    def __init__(self, fast_workers=FAST_WORKERS, max_slow_jobs=MAX_SLOW_JOBS, max_pending=MAX_PENDING):
+        self.lanes = {
+            "fast": ThreadPoolExecutor(max_workers=fast_workers, thread_name_prefix="fast-lane"),
+            "slow": ThreadPoolExecutor(max_workers=max_slow_jobs, thread_name_prefix="slow-lane"),
+        }
+        self.pending = {"fast": 0, "slow": 0}   # Submitted jobs not yet finished, per lane
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._completed = queue.Queue()
+
+    def submit(self, lane, job, room):
+        """
+        Run job() -> response on a lane, the response is later posted to room.
+        Returns False without running the job if the lane is full.
+        """
+        with self._lock:
+            if self.pending[lane] >= self.max_pending[lane]:
+                return False
+            self.pending[lane] += 1
+        self.lanes[lane].submit(self._run, lane, job, room)
+        return True
+
+    def _run(self, lane, job, room):
+        try:
+            response = job()
+        except Exception as e:
+            response = f"Error processing query: {str(e)}"
+        with self._lock:
+            self.pending[lane] -= 1
+        self._completed.put((room, response))
+
+    def deliver(self, timeout):
+        """Post finished responses to their rooms as they arrive, for timeout seconds."""
+        delivered = 0
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return delivered
+            try:
+                room, response = self._completed.get(timeout=remaining)
+            except queue.Empty:
+                return delivered
+            room.post_messages(f"{response}")
+            delivered += 1
+
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane.shutdown(wait=False, cancel_futures=True)
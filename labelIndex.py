@@ -0,0 +1,34 @@
+import csv
+from rdflib import Graph, Namespace, RDFS
+from rdflib.namespace import SKOS
+from label_normalization import normalize_label
+
+# Namespaces
+WDT = Namespace('http://www.wikidata.org/prop/direct/')
+SCHEMA = Namespace('http://schema.org/')
+
+# Primary labels first, so they take precedence over aliases with the same key
+label_predicates = [RDFS.label, SKOS.prefLabel, SCHEMA.name, SKOS.altLabel, SCHEMA.alternateName]
+
+# Load the graph
+graph = Graph()
+graph.parse('./14_graph.nt', format='turtle')
+
+# Collect the normalized key of every label and alias
+rows = []
+seen = set()
+for label_predicate in label_predicates:
+    for subject, label in graph.subject_objects(label_predicate):
+        key = normalize_label(label)
+        kind = 'predicate' if str(subject).startswith(str(WDT)) else 'entity'
+        if key and (kind, key, str(subject)) not in seen:
+            seen.add((kind, key, str(subject)))
+            rows.append((kind, key, str(subject)))
+
+# Write the results into a CSV file
+with open('./label_keys.csv', mode='w', newline='', encoding='utf-8') as file:
+    writer = csv.writer(file)
+    writer.writerow(['Kind', 'Key', 'URI'])
+    writer.writerows(rows)
+
+print(f"{len(rows)} normalized label keys have been written to label_keys.csv.")
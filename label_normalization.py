@@ -0,0 +1,17 @@
+import re
+import unicodedata
+
+articles = {'the', 'a', 'an'}
+
+def normalize_label(text):
+    """
+    Normalized lookup key of a label: casefolded, without accents, punctuation and a leading article.
+    "The Lord of the Rings: The Two Towers" -> "lord of the rings the two towers"
+    """
+    text = unicodedata.normalize('NFKD', str(text).casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"['’]", '', text)       # "Schindler's" -> "schindlers"
+    words = re.sub(r'[^\w\s]|_', ' ', text).split()
+    if len(words) > 1 and words[0] in articles:
+        words = words[1:]
+    return ' '.join(words)
@@ -1,5 +1,6 @@
 import pandas as pd
 from rdflib import Graph, Namespace, URIRef, RDFS
+from movie_store import write_columns
 
 # Namespaces
 WD = Namespace('http://www.wikidata.org/entity/')
@@ -33,6 +34,10 @@ movie_data = {}  # Dictionary to store movie titles and their respective feature
 
 # Loop through all the movie URIs (assuming that movies are in the WD namespace)
 for movie_uri in graph.subjects(predicate=RDFS.label):
+    # Skip labelled nodes that are not WD items, e.g. predicates ("node label", "cast member")
+    if not str(movie_uri).startswith(str(WD) + 'Q'):
+        continue
+
     # Extract movie title
     title = None
     for label in graph.objects(movie_uri, RDFS.label):
@@ -43,14 +48,16 @@ for movie_uri in graph.subjects(predicate=RDFS.label):
     if title:
         # Get the features and values for the movie
         features, values = get_movie_features(movie_uri)
-        movie_data[title] = {'features': features, 'values': values}
+        movie_data[title] = {'uri': str(movie_uri), 'features': features, 'values': values}
 
 # Step 3: Convert movie data into a DataFrame
 data = []  # List to store rows for the DataFrame
+columns = []  # All values of each feature, for the columnar store
 
 # Iterate over the movie data
 for title, feature_value in movie_data.items():
     row = {'Title': title}
+    column_values = {column_name: [] for column_name in predicate_to_column.values()}
     # Filter the feature-value pairs and map the predicate URIs to human-readable column names
     for feature, value in zip(feature_value['features'], feature_value['values']):
         # Check if the feature is in the desired mapping
@@ -69,7 +76,12 @@ for title, feature_value in movie_data.items():
             else:
                 # If not a URI, just assign the value directly
                 row[column_name] = value
-    data.append(row)
+            column_values[column_name].append(str(row[column_name]))
+
+    # Skip entities without any of the movie features
+    if len(row) > 1:
+        data.append(row)
+        columns.append((feature_value['uri'], title, column_values))
 
 # Convert the data to a DataFrame
 df = pd.DataFrame(data)
@@ -78,3 +90,13 @@ df = pd.DataFrame(data)
 df.to_csv('./movie_features.csv', index=False)
 
 print("Data saved to movie_features.csv")
+
+# Step 5: Save the typed columnar store, multi-valued features keep all their values
+write_columns('./movie_features',
+              entities=[int(uri[len(str(WD)) + 1:]) for uri, _, _ in columns],
+              titles=[title for _, title, _ in columns],
+              categorical={column_name: [values[column_name] for _, _, values in columns]
+                           for column_name in ['director', 'genre', 'publisher']},
+              dates=[min(values['publication date'], default=None) for _, _, values in columns])
+
+print("Columnar data saved to movie_features/")
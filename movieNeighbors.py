@@ -0,0 +1,60 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import rdflib
+from rdflib import Graph, Namespace, RDFS
+from sklearn.metrics import pairwise_distances
+from threadpoolctl import threadpool_limits
+
+# Namespaces
+WD = Namespace('http://www.wikidata.org/entity/')
+WDT = Namespace('http://www.wikidata.org/prop/direct/')
+
+k = 20              # Neighbors stored per film
+block_size = 1024   # Films per block, bounds the distance matrix to block_size x number of films
+n_workers = os.cpu_count()
+
+# Load the graph
+graph = Graph()
+graph.parse('./14_graph.nt', format='turtle')
+
+# Load the embeddings and the entity dictionary
+entity_emb = np.load(r'./entity_embeds.npy')
+with open(r'./entity_ids.del', 'r', encoding='utf-8') as ifile:
+    ent2id = {rdflib.term.URIRef(ent): int(idx) for idx, ent in csv.reader(ifile, delimiter='\t')}
+
+# Step 1: Collect the film entities (instance of film) that have an embedding and a label
+films = []
+labels = []
+for film in set(graph.subjects(WDT.P31, WD.Q11424)):
+    label = graph.value(film, RDFS.label)
+    if film in ent2id and label is not None:
+        films.append(ent2id[film])
+        labels.append(str(label))
+order = np.argsort(films)
+films = np.array(films, dtype=np.int32)[order]
+labels = np.array(labels)[order]
+film_emb = entity_emb[films]
+
+# Step 2: Find the k nearest films of every film, block by block on several threads.
+# Each thread computes its block with a single-threaded BLAS, so the threads do not oversubscribe the cores
+def nearest_films(start):
+    block = film_emb[start:start + block_size]
+    dist = pairwise_distances(block, film_emb)
+    dist[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf  # Skip the film itself
+    n = min(k, len(films) - 1)
+    nearest = np.argpartition(dist, n, axis=1)[:, :n]
+    nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+    ranked = np.argsort(nearest_dist, axis=1)
+    return np.take_along_axis(nearest, ranked, axis=1), np.take_along_axis(nearest_dist, ranked, axis=1)
+
+with threadpool_limits(limits=1, user_api='blas'), ThreadPoolExecutor(max_workers=n_workers) as executor:
+    blocks = list(executor.map(nearest_films, range(0, len(films), block_size)))
+
+# Step 3: Save the neighbor lists as film positions: the neighbors of films[i] are films[neighbors[i]]
+neighbors = np.concatenate([nearest for nearest, _ in blocks]).astype(np.int32)
+distances = np.concatenate([nearest_dist for _, nearest_dist in blocks]).astype(np.float32)
+np.savez('./movie_neighbors.npz', films=films, labels=labels, neighbors=neighbors, distances=distances)
+
+print(f"Neighbor lists of {len(films)} films have been written to movie_neighbors.npz.")
@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+
+# Dictionary-encoded, multi-valued columns
+categorical_columns = ['director', 'genre', 'publisher']
+# Variable-length string columns; every other column is a plain typed array
+string_columns = ['title']
+
+def write_columns(path, entities, titles, categorical, dates):
+    """
+    Write the movie features as one NumPy file per column.
+    entities: Wikidata entity numbers (Q123 -> 123), titles: strings,
+    categorical: {column: [[value, ...] per movie]}, dates: [date string or None per movie].
+    A categorical column is stored as a dictionary of distinct values and a CSR layout of codes:
+    the values of movie i are dictionary[codes[offsets[i]:offsets[i + 1]]].
+    Strings (titles and dictionaries) are stored as UTF-8 bytes in the same layout: string i is
+    data[offsets[i]:offsets[i + 1]].
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'entity.npy'), np.array(entities, dtype=np.int64))
+    save_strings(path, 'title', titles)
+    np.save(os.path.join(path, 'publication_date.npy'),
+            np.array([date[:10] if date else 'NaT' for date in dates], dtype='datetime64[D]'))
+
+    for column in categorical_columns:
+        dictionary = sorted({value for values in categorical[column] for value in values})
+        codes_of = {value: code for code, value in enumerate(dictionary)}
+        offsets = np.zeros(len(titles) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(values) for values in categorical[column]])
+        codes = np.array([codes_of[value] for values in categorical[column] for value in values], dtype=np.int32)
+        save_strings(path, f'{column}.dictionary', dictionary)
+        np.save(os.path.join(path, f'{column}.offsets.npy'), offsets)
+        np.save(os.path.join(path, f'{column}.codes.npy'), codes)
+
+    with open(os.path.join(path, 'columns.json'), 'w') as file:
+        json.dump({'rows': len(titles), 'categorical': categorical_columns, 'strings': string_columns,
+                   'plain': ['entity', 'publication_date']}, file)
+
+def save_strings(path, name, strings):
+    """Write strings as their concatenated UTF-8 bytes (name.data.npy) and byte offsets (name.offsets.npy)."""
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(string) for string in encoded])
+    np.save(os.path.join(path, f'{name}.data.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(path, f'{name}.offsets.npy'), offsets)
+
+def load_strings(path, name):
+    """Read strings written by save_strings into an object array."""
+    data = np.load(os.path.join(path, f'{name}.data.npy'), mmap_mode='r').tobytes()
+    offsets = np.load(os.path.join(path, f'{name}.offsets.npy')).tolist()
+    return np.array([data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])],
+                    dtype=object)
+
+def load_column(path, column):
+    """
+    Load one column: a memory-mapped array for plain columns, a decoded object array for
+    string columns and a (dictionary, offsets, codes) tuple for categorical columns,
+    with the offsets and codes memory-mapped.
+    """
+    if column in categorical_columns:
+        return (load_strings(path, f'{column}.dictionary'),
+                np.load(os.path.join(path, f'{column}.offsets.npy'), mmap_mode='r'),
+                np.load(os.path.join(path, f'{column}.codes.npy'), mmap_mode='r'))
+    if column in string_columns:
+        return load_strings(path, column)
+    return np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r')
+
+def join_values(column, separator=' '):
+    """Join the values of a categorical column into one string per movie."""
+    dictionary, offsets, codes = column
+    values = np.asarray(dictionary)[np.asarray(codes)]
+    return [separator.join(values[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
@@ -5,82 +5,292 @@ from rdflib import Graph, Namespace, URIRef, Literal, RDFS
 import rdflib
 import numpy as np
 import csv
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import process_v3
 import process_v4
 import process_v5
+import deadline
+from label_normalization import normalize_label
+from collections import OrderedDict
 
 WD = Namespace('http://www.wikidata.org/entity/')
 WDT = Namespace('http://www.wikidata.org/prop/direct/')
 SCHEMA = Namespace('http://schema.org/')
 DDIS = Namespace('http://ddis.ch/atai/')
 
-# Load the graph
+# Number of row shards the embedding search is split into, searched in parallel
+embedding_shards = 1
+shard_executor = None
+
+# Load the graph, the pruned serving graph (built by pruneGraph.py) if it is available
+use_serving_graph = True
+graph_path = './14_graph_serving.nt' if use_serving_graph and os.path.exists('./14_graph_serving.nt') else './14_graph.nt'
 graph = Graph()
-graph.parse('./14_graph.nt', format='turtle')
+graph.parse(graph_path, format='turtle')
+
+def load_embeddings():
+    """
+    Load the embeddings, their dictionaries and the relation ranges as one index,
+    so they are always replaced together.
+    """
+    index = {}
+    index["entity_emb"] = np.load(r'./entity_embeds.npy')
+    index["relation_emb"] = np.load(r'./relation_embeds.npy')
+
+    # Load the dictionaries
+    with open(r'./entity_ids.del', 'r', encoding='utf-8') as ifile:
+        index["ent2id"] = {rdflib.term.URIRef(ent): int(idx) for idx, ent in csv.reader(ifile, delimiter='\t')}
+        index["id2ent"] = {v: k for k, v in index["ent2id"].items()}
+    with open(r'./relation_ids.del', 'r', encoding='utf-8') as ifile:
+        index["rel2id"] = {rdflib.term.URIRef(rel): int(idx) for idx, rel in csv.reader(ifile, delimiter='\t')}
+        index["id2rel"] = {v: k for k, v in index["rel2id"].items()}
+
+    # Load the observed range of each relation (built by relationRanges.py), relation r has the
+    # candidate answers range_indices[range_indptr[r]:range_indptr[r + 1]]
+    if os.path.exists(r'./relation_ranges.npz'):
+        with np.load(r'./relation_ranges.npz') as ranges:
+            index["range_indptr"], index["range_indices"] = ranges['indptr'], ranges['indices']
+    else:
+        index["range_indptr"] = np.zeros(len(index["rel2id"]) + 1, dtype=np.int64)
+        index["range_indices"] = np.zeros(0, dtype=np.int32)
+    return index
 
-# Load the embeddings
-entity_emb = np.load(r'./entity_embeds.npy')
-relation_emb = np.load(r'./relation_embeds.npy')
 
-# Load the dictionaries
-with open(r'./entity_ids.del', 'r', encoding='utf-8') as ifile:
-    ent2id = {rdflib.term.URIRef(ent): int(idx) for idx, ent in csv.reader(ifile, delimiter='\t')}
-    id2ent = {v: k for k, v in ent2id.items()}
-with open(r'./relation_ids.del', 'r', encoding='utf-8') as ifile:
-    rel2id = {rdflib.term.URIRef(rel): int(idx) for idx, rel in csv.reader(ifile, delimiter='\t')}
-    id2rel = {v: k for k, v in rel2id.items()}
+embedding_files = [r'./entity_embeds.npy', r'./relation_embeds.npy', r'./entity_ids.del', r'./relation_ids.del',
+                   r'./relation_ranges.npz']
+embeddings = load_embeddings()
 
 ent2lbl = {ent: str(lbl) for ent, lbl in graph.subject_objects(RDFS.label)}
 lbl2ent = {lbl: ent for ent, lbl in ent2lbl.items()}
 
+def load_catalog(path, kind):
+    """
+    Load a {URI: Name} dictionary from a CSV file, with hash indexes to URIs from the
+    case-folded names and from normalized label keys (including the aliases in label_keys.csv,
+    built by labelIndex.py). Normalized keys drop articles and punctuation, so different names
+    can share a key; the case-folded names are looked up first.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)  # Skip header
+        names = {row[0]: row[1] for row in reader}
+
+    exact = {}
+    keys = {}
+    for uri, name in names.items():
+        exact.setdefault(name.casefold(), uri)
+        keys.setdefault(normalize_label(name), uri)
+    if os.path.exists(label_keys_path):
+        with open(label_keys_path, 'r', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader)  # Skip header
+            for row_kind, key, uri in reader:
+                if row_kind == kind:
+                    keys.setdefault(key, uri)
+    keys.pop('', None)
+
+    # Lowercased names for the edit-distance fallback
+    lowered = [(name.lower(), uri) for uri, name in names.items()]
+    return {"names": names, "exact": exact, "keys": keys, "lowered": lowered}
+
+
 # Load entities and predicates from CSV files
-entities = {}
-predicates = {}
+label_keys_path = './label_keys.csv'
+entity_catalog = load_catalog('./entities.csv', 'entity')  # {Entity URI: Entity Name} and lookup keys
+predicate_catalog = load_catalog('./predicates.csv', 'predicate')  # {Predicate URI: Predicate Name} and lookup keys
+
 
-with open('./entities.csv', 'r', encoding='utf-8') as file:
-    reader = csv.reader(file)
-    next(reader)  # Skip header
-    entities = {row[0]: row[1] for row in reader}  # {Entity URI: Entity Name}
+def register_artifacts(manager):
+    """
+    Let the artifact manager reload the data files of this module and of the answer modules.
+    """
+    def swap(name):
+        def assign(value):
+            globals()[name] = value
+        return assign
+
+    manager.register("entities", ['./entities.csv', label_keys_path],
+                     lambda _: load_catalog('./entities.csv', 'entity'), swap("entity_catalog"), entity_catalog)
+    manager.register("predicates", ['./predicates.csv', label_keys_path],
+                     lambda _: load_catalog('./predicates.csv', 'predicate'), swap("predicate_catalog"),
+                     predicate_catalog)
+    manager.register("embeddings", embedding_files, lambda _: load_embeddings(),
+                     swap("embeddings"), embeddings)
+    process_v3.register_artifacts(manager)
+    process_v5.register_artifacts(manager)
+
+
+multi_medias = ["picture", "look like", "looks like", "photo"]
 
-with open('./predicates.csv', 'r', encoding='utf-8') as file:
-    reader = csv.reader(file)
-    next(reader)  # Skip header
-    predicates = {row[0]: row[1] for row in reader}  # {Predicate URI: Predicate Name}
+
+def questionCategory(question):
+    """
+    Category of a question before answering it: "recommendation", "multi_media" or "other".
+    """
+    if "recommend" in question.lower():
+        return "recommendation"
+    elif any(multi_media in question.lower() for multi_media in multi_medias):
+        return "multi_media"
+    return "other"
 
 
-def handleQuestion(question) -> (str, str):
-    multi_medias = ["picture", "look like", "looks like", "photo"]
+# Recent answers, returned when a question runs out of its latency budget
+answer_cache = OrderedDict()
+answer_cache_size = 1024
+answer_cache_lock = threading.Lock()  # Questions are answered on several job lane threads
 
-    if "recommend" in question.lower():  # Recommendation question
-        result = process_v3.handleRecommendation(question)
-        return "recommendation", result
-    elif any(multi_media in question.lower() for multi_media in multi_medias):  # Multi-media question
+
+def handleQuestion(question, budget=None) -> (str, str):
+    """
+    Answer a question. With a deadline.Budget, stages that run out of time degrade:
+    a cached answer is returned or the embedding fallback is skipped. Without a cached
+    answer, the question type is "timed_out".
+    """
+    budget = budget or deadline.Budget()
+    if budget.expired():
+        deadline.record("expired_before_start")
+        return timedOutAnswer(question)
+
+    category = questionCategory(question)
+    if category == "recommendation":  # Recommendation question
+        result = process_v3.handleRecommendation(question, budget)
+        return cacheAnswer(question, "recommendation", result)
+    elif category == "multi_media":  # Multi-media question
         result = process_v4.handleMultiMedia(question)
         return "multi_media", result
     else:
-        matched_entity = match_entity(question)
-        matched_relation = match_relation(question)
+        matched_entity = match_entity(question, budget)
+        matched_relation = match_relation(question, budget)
 
         result = process_v5.handleCrowdSourcing(matched_entity, matched_relation)    # Crowd-sourcing question
         if result:
-            return "crowd_sourcing", result
+            return cacheAnswer(question, "crowd_sourcing", result)
         else:
-            result = handleFactual(matched_entity, matched_relation)  # Factual question
+            result = list(handleFactual(matched_entity, matched_relation))  # Factual question
             if result:  
-                return "factual", result
+                return cacheAnswer(question, "factual", result)
+            elif budget.expired():
+                deadline.record("skipped_embedding")
+                return timedOutAnswer(question)
             else:
                 result = handleEmbedding(matched_entity, matched_relation)  # Embedding question
                 if result:  
-                    return "embedding", result
+                    return cacheAnswer(question, "embedding", result)
         
     return None, None
 
 
-def match_entity(question):
+def cacheAnswer(question, questionType, result):
+    with answer_cache_lock:
+        answer_cache[question] = (questionType, result)
+        answer_cache.move_to_end(question)
+        if len(answer_cache) > answer_cache_size:
+            answer_cache.popitem(last=False)
+    return questionType, result
+
+
+def cachedAnswer(question):
+    """
+    Cached answer of a question that ran out of time or was shed, or (None, None).
+    """
+    with answer_cache_lock:
+        answer = answer_cache.get(question)
+    if answer is None:
+        return None, None
+    deadline.record("cached_answer")
+    return answer
+
+
+def timedOutAnswer(question):
+    """
+    Cached answer of a question that ran out of time, or ("timed_out", None).
+    """
+    questionType, result = cachedAnswer(question)
+    if questionType is None:
+        return "timed_out", None
+    return questionType, result
+
+
+def handleQuestions(questions, batch_size=32):
+    """
+    Answer a list of questions in batches.
+    Yields (index, questionType, result) tuples as soon as each answer is ready,
+    so the order of the results does not follow the order of the questions.
+    """
+    # Resolutions are shared across batches, repeated names are only matched once
+    entity_cache = {}
+    relation_cache = {}
+
+    for start in range(0, len(questions), batch_size):
+        batch = list(enumerate(questions[start:start + batch_size], start))
+
+        categories = [questionCategory(q) for _, q in batch]
+        recommendation_questions = [item for item, c in zip(batch, categories) if c == "recommendation"]
+        multi_media_questions = [item for item, c in zip(batch, categories) if c == "multi_media"]
+        other_questions = [item for item, c in zip(batch, categories) if c == "other"]
+
+        # Crowd-sourcing and factual answers per unique (entity, relation) pair
+        pairs = {}
+        for i, question in other_questions:
+            entity_part = extract_entity_part(question)
+            relation_part = extract_relation_part(question)
+            if not entity_part or not relation_part:
+                yield i, None, None
+                continue
+            if entity_part not in entity_cache:
+                entity_cache[entity_part] = resolve_entity(entity_part)
+            if relation_part not in relation_cache:
+                relation_cache[relation_part] = resolve_relation(relation_part)
+            pairs.setdefault((entity_cache[entity_part], relation_cache[relation_part]), []).append(i)
+
+        embedding_pairs = []
+        for (entity, relation), indices in pairs.items():
+            result = process_v5.handleCrowdSourcing(entity, relation)    # Crowd-sourcing question
+            if result:
+                for i in indices:
+                    yield i, "crowd_sourcing", result
+                continue
+            result = handleFactual(entity, relation)  # Factual question
+            if result:
+                for i in indices:
+                    yield i, "factual", result
+                continue
+            embedding_pairs.append((entity, relation))
+
+        # All embedding questions of the batch are scored in one matrix operation
+        for (entity, relation), result in zip(embedding_pairs, handleEmbeddings(embedding_pairs)):
+            for i in pairs[(entity, relation)]:
+                yield (i, "embedding", result) if result else (i, None, None)
+
+        if recommendation_questions:
+            results = process_v3.handleRecommendations([q for _, q in recommendation_questions])
+            for (i, _), result in zip(recommendation_questions, results):
+                yield i, "recommendation", result
+
+        if multi_media_questions:
+            results = process_v4.handleMultiMedias([q for _, q in multi_media_questions])
+            for (i, _), result in zip(multi_media_questions, results):
+                yield i, "multi_media", result
+
+
+def match_entity(question, budget=None):
     """
     Match entities based on entity names in the question.
     """
-    # Extract the potential entity from the question
+    entity_part = extract_entity_part(question)
+    if not entity_part:
+        print("No matching pattern found in the question.")
+        return None
+
+    return resolve_entity(entity_part, budget)
+
+
+def extract_entity_part(question):
+    """
+    Extract the potential entity name from the question.
+    """
     entity_part = None
     patterns = [
         r"who is the (.+?) of (.+?)\?",
@@ -95,38 +305,59 @@ def match_entity(question):
             entity_part = match.group(2) if pattern != r'when was \"(.+?)\" (.+?)d\?' else match.group(1)
             break
 
-    if not entity_part:
-        print("No matching pattern found in the question.")
-        return None
+    return entity_part
 
-    # Match against the entities dictionary
-    entity = None
+
+def resolve_entity(entity_part, budget=None):
+    """
+    Match an extracted entity name against the entities dictionary: an exact match on the
+    case-folded name first, then on the normalized key, then the closest name by edit distance.
+    If the budget runs out during the scan, the closest match so far is returned.
+    """
+    catalog = entity_catalog  # Keep using this version if the entities are reloaded meanwhile
     min_distance = float('inf')
 
     print(f"--- Matching entity for \"{entity_part}\" ---\n")
 
-    for uri, name in entities.items():
-        name_lower = name.lower()
-        if name_lower == entity_part.lower():
-            entity = uri  # Exact match
-            print(f"Exact match found: {name} -> {uri}")
-            return entity
+    entity = catalog["exact"].get(entity_part.casefold())
+    if entity is None:
+        entity = catalog["keys"].get(normalize_label(entity_part))
+    if entity is not None:
+        print(f"Exact match found: {catalog['names'].get(entity, entity_part)} -> {entity}")
+        return entity
+
+    part_lower = entity_part.lower()
+    for i, (name_lower, uri) in enumerate(catalog["lowered"]):
+        if budget is not None and i % 4096 == 4095 and budget.expired():
+            deadline.record("partial_entity_match")
+            break
 
         # Use edit distance for approximate match
-        distance = editdistance.eval(name_lower, entity_part.lower())
+        distance = editdistance.eval(name_lower, part_lower)
         if distance < min_distance:
             min_distance = distance
             entity = uri
 
-    print(f"Closest match found: {entities.get(entity)} with distance {min_distance}")
+    print(f"Closest match found: {catalog['names'].get(entity)} with distance {min_distance}")
     return entity
 
 
-def match_relation(question):
+def match_relation(question, budget=None):
     """
     Match relations based on relation names in the question.
     """
-    # Extract the potential relation from the question
+    relation_part = extract_relation_part(question)
+    if not relation_part:
+        print("No matching relation pattern found in the question.")
+        return None
+
+    return resolve_relation(relation_part, budget)
+
+
+def extract_relation_part(question):
+    """
+    Extract the potential relation name from the question.
+    """
     relation_part = None
     patterns = [
         r"who is the (.+?) of\b",      
@@ -141,30 +372,40 @@ def match_relation(question):
             relation_part = match.group(1) if pattern != r'when was \"(.+?)\" (.+?)d\?' else match.group(2)
             break
 
-    if not relation_part:
-        print("No matching relation pattern found in the question.")
-        return None
+    return relation_part
+
 
-    # Match against the predicates dictionary
-    relation = None
+def resolve_relation(relation_part, budget=None):
+    """
+    Match an extracted relation name against the predicates dictionary: an exact match on the
+    case-folded name first, then on the normalized key, then the closest name by edit distance.
+    If the budget runs out during the scan, the closest match so far is returned.
+    """
+    catalog = predicate_catalog  # Keep using this version if the predicates are reloaded meanwhile
     min_distance = float('inf')
 
     print(f"--- Matching relation for \"{relation_part}\" ---\n")
 
-    for uri, name in predicates.items():
-        name_lower = name.lower()
-        if name_lower == relation_part.lower():
-            relation = uri  # Exact match
-            print(f"Exact match found: {name} -> {uri}")
-            return relation
+    relation = catalog["exact"].get(relation_part.casefold())
+    if relation is None:
+        relation = catalog["keys"].get(normalize_label(relation_part))
+    if relation is not None:
+        print(f"Exact match found: {catalog['names'].get(relation, relation_part)} -> {relation}")
+        return relation
+
+    part_lower = relation_part.lower()
+    for i, (name_lower, uri) in enumerate(catalog["lowered"]):
+        if budget is not None and i % 4096 == 4095 and budget.expired():
+            deadline.record("partial_relation_match")
+            break
 
         # Use edit distance for approximate match
-        distance = editdistance.eval(name_lower, relation_part.lower())
+        distance = editdistance.eval(name_lower, part_lower)
         if distance < min_distance:
             min_distance = distance
             relation = uri
 
-    print(f"Closest match found: {predicates.get(relation)} with distance {min_distance}")
+    print(f"Closest match found: {catalog['names'].get(relation)} with distance {min_distance}")
     return relation
 
 
@@ -186,20 +427,86 @@ def handleEmbedding(entity, relation):
     """
     Handle embedding-based queries using entity and relation embeddings.
     """
-    entity_id = ent2id.get(rdflib.term.URIRef(entity))
-    relation_id = rel2id.get(rdflib.term.URIRef(relation))
+    return handleEmbeddings([(entity, relation)])[0]
 
-    if entity_id is None or relation_id is None:
+
+def handleEmbeddings(pairs):
+    """
+    Handle a list of (entity, relation) embedding queries with a single distance computation.
+    """
+    index = embeddings  # Keep using this version if the embeddings are reloaded meanwhile
+    results = [None] * len(pairs)
+    queries = {}    # {relation_id: ([row, ...], [entity_id, ...])}
+    for row, (entity, relation) in enumerate(pairs):
+        entity_id = index["ent2id"].get(rdflib.term.URIRef(entity))
+        relation_id = index["rel2id"].get(rdflib.term.URIRef(relation))
+        if entity_id is None or relation_id is None:
+            continue
+        rows, heads = queries.setdefault(relation_id, ([], []))
+        rows.append(row)
+        heads.append(entity_id)
+
+    # Queries of the same relation are scored together against the relation's candidate answers
+    for relation_id, (rows, heads) in queries.items():
+        lhs = index["entity_emb"][heads] + index["relation_emb"][relation_id]
+        candidates = relation_range(index, relation_id)
+        top_3 = search_embeddings(index, lhs, candidates, 3)
+
+        for row, top_3_idxs in zip(rows, top_3):
+            top_3_labels = [ent2lbl.get(index["id2ent"][idx], "No Label") for idx in top_3_idxs]
+            results[row] = ",".join(top_3_labels)
+
+    return results
+
+
+def relation_range(index, relation_id):
+    """
+    Entity IDs observed as objects of a relation, or None if its range is unknown.
+    """
+    range_indptr = index["range_indptr"]
+    if relation_id + 1 >= len(range_indptr):
         return None
+    candidates = index["range_indices"][range_indptr[relation_id]:range_indptr[relation_id + 1]]
+    return candidates if len(candidates) else None
 
-    head = entity_emb[entity_id]
-    pred = relation_emb[relation_id]
 
-    lhs = head + pred
-    dist = pairwise_distances(lhs.reshape(1, -1), entity_emb).reshape(-1)
-    most_likely = dist.argsort()
+def search_embeddings(index, lhs, candidates, k):
+    """
+    Return the IDs of the k entities closest to each row of lhs, searching only the
+    candidate entity IDs if given. With several shards the rows are split into contiguous
+    shards searched in parallel; ties are broken by entity ID, so the result does not
+    depend on the number of shards.
+    """
+    global shard_executor
+
+    n = len(index["entity_emb"]) if candidates is None else len(candidates)
+    bounds = np.linspace(0, n, max(1, min(embedding_shards, n)) + 1).astype(int)
+    shards = list(zip(bounds[:-1], bounds[1:]))
+
+    if len(shards) == 1:
+        results = [search_shard(index, lhs, candidates, 0, n, k)]
+    else:
+        if shard_executor is None:
+            shard_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        results = list(shard_executor.map(lambda shard: search_shard(index, lhs, candidates, *shard, k), shards))
 
-    top_3_idxs = most_likely[:3]
-    top_3_labels = [ent2lbl.get(id2ent[idx], "No Label") for idx in top_3_idxs]
+    # Merge the per-shard top k by distance, then by entity ID
+    ids = np.concatenate([shard_ids for shard_ids, _ in results], axis=1)
+    dist = np.concatenate([shard_dist for _, shard_dist in results], axis=1)
+    order = np.lexsort((ids, dist), axis=1)[:, :k]
+    return np.take_along_axis(ids, order, axis=1)
 
-    return ",".join(top_3_labels)
+
+def search_shard(index, lhs, candidates, start, end, k):
+    """
+    Top k entity IDs and distances for each row of lhs within rows start:end of the search space.
+    """
+    entity_emb = index["entity_emb"]
+    if candidates is None:
+        ids = np.arange(start, end)
+        dist = pairwise_distances(lhs, entity_emb[start:end])
+    else:
+        ids = candidates[start:end]
+        dist = pairwise_distances(lhs, entity_emb[ids])
+    nearest = dist.argsort(axis=1, kind='stable')[:, :k]
+    return ids[nearest], np.take_along_axis(dist, nearest, axis=1)
@@ -1,60 +1,161 @@
 from transformers import pipeline
+from collections import Counter
+import os
+import numpy as np
 import pandas as pd
+import deadline
+import movie_store
 from sklearn.neighbors import NearestNeighbors
 from sklearn.feature_extraction.text import TfidfVectorizer
 
-# Load movie features from the CSV file
-df = pd.read_csv('./movie_features.csv')
+def load_recommender():
+    """Build the TF-IDF KNN recommender from the columnar movie features, or from movie_features.csv."""
+    if os.path.isdir('./movie_features'):
+        # Read only the columns the recommender needs
+        dates = movie_store.load_column('./movie_features', 'publication_date')
+        df = pd.DataFrame({
+            'Title': movie_store.load_column('./movie_features', 'title'),
+            'director': movie_store.join_values(movie_store.load_column('./movie_features', 'director')),
+            'genre': movie_store.join_values(movie_store.load_column('./movie_features', 'genre')),
+            'publisher': movie_store.join_values(movie_store.load_column('./movie_features', 'publisher')),
+            'publication date': np.where(np.isnat(dates), '', np.datetime_as_string(dates)),
+        })
+    else:
+        # Load movie features from the CSV file
+        df = pd.read_csv('./movie_features.csv')
 
-# Fill NaN values with an empty string for vectorization
-df = df.fillna('')
+        # Fill NaN values with an empty string for vectorization
+        df = df.fillna('')
 
-# Combine the features into a single column for vectorization (you can include more columns if needed)
-df['combined_features'] = df['director'] + ' ' + df['genre'] + ' ' + df['publisher'] + ' ' + df['publication date'] 
+    # Combine the features into a single column for vectorization (you can include more columns if needed)
+    df['combined_features'] = df['director'] + ' ' + df['genre'] + ' ' + df['publisher'] + ' ' + df['publication date'] 
 
-# Vectorization using TF-IDF
-vectorizer = TfidfVectorizer(stop_words='english')
-X = vectorizer.fit_transform(df['combined_features'])
+    # Vectorization using TF-IDF
+    vectorizer = TfidfVectorizer(stop_words='english')
+    X = vectorizer.fit_transform(df['combined_features'])
 
-# Fit KNN model
-knn = NearestNeighbors(n_neighbors=5, metric='cosine')
-knn.fit(X)
+    # Fit KNN model
+    knn = NearestNeighbors(n_neighbors=5, metric='cosine')
+    knn.fit(X)
+    return {"df": df, "X": X, "knn": knn}
+
+def load_neighbors():
+    """Load the precomputed film neighbor lists (built by movieNeighbors.py)."""
+    with np.load('./movie_neighbors.npz') as movie_neighbors:
+        labels = pd.Series(movie_neighbors['labels'])
+        neighbors = movie_neighbors['neighbors']
+    positions = {label.lower(): i for i, label in reversed(list(enumerate(labels)))}
+    return {"labels": labels, "neighbors": neighbors, "positions": positions}
+
+# If the film neighbor lists are present, recommendations are merged from the embedding neighbors
+# instead of the TF-IDF features; only the index of the backend in use is built
+if os.path.exists('./movie_neighbors.npz'):
+    recommendation_backend = "embedding"
+    neighbor_index = load_neighbors()
+    recommender = None
+else:
+    recommendation_backend = "tfidf"
+    neighbor_index = None
+    recommender = load_recommender()
+
+def register_artifacts(manager):
+    """Let the artifact manager rebuild the index of the recommendation backend when its files change."""
+    def swap(name):
+        def assign(value):
+            globals()[name] = value
+        return assign
+    if recommendation_backend == "embedding":
+        manager.register("movie_neighbors", ['./movie_neighbors.npz'], lambda _: load_neighbors(),
+                         swap("neighbor_index"), neighbor_index)
+    else:
+        manager.register("movie_features", ['./movie_features.csv', './movie_features/columns.json'],
+                         lambda _: load_recommender(), swap("recommender"), recommender)
 
 ner_pipeline = pipeline('ner', model='dbmdz/bert-large-cased-finetuned-conll03-english')
 
-def handleRecommendation(question):
-    entities = ner_pipeline(question, aggregation_strategy="simple")
+max_degraded_recommendations = 5  # Candidates kept when the clean-up pass is skipped
+
+def handleRecommendation(question, budget=None):
+    return handleRecommendations([question], budget=budget)[0]
+
+def handleRecommendations(questions, batch_size=16, budget=None):
+    """
+    Answer several recommendation questions with batched NER forward passes.
+    If the budget runs out before the NER clean-up pass, it is skipped and only the first
+    candidates are kept.
+    """
+    # Extract movie names (entities) from NER, one batched pass over all questions
+    all_entities = ner_pipeline(questions, aggregation_strategy="simple", batch_size=batch_size)
+
+    if recommendation_backend == "embedding":
+        return [recommendFromNeighbors([entity['word'] for entity in entities]) for entities in all_entities]
+
+    # Keep using this version of the recommender if it is reloaded meanwhile
+    df, X, knn = recommender["df"], recommender["X"], recommender["knn"]
 
-    # Extract movie names (entities) from NER
-    favorite_movies = [entity['word'] for entity in entities]
-    
     # Search for these movies in the DataFrame and get their indices
-    movie_indices = []
-    for movie in favorite_movies:
-        matched_movies = df[df['Title'].str.contains(movie, case=False)]
-        if not matched_movies.empty:
-            movie_indices.append(matched_movies.index[0])
-
-    # If there are favorite movies, find similar movies using KNN
-    recommendations = []
-    if movie_indices:
-        # Get the feature vectors of the favorite movies
-        movie_features = X[movie_indices]
-        
-        # Get KNN recommendations for these movies
-        distances, indices = knn.kneighbors(movie_features)
-        
+    title_matches = {}
+    all_movie_indices = []
+    for entities in all_entities:
+        favorite_movies = [entity['word'] for entity in entities]
+        movie_indices = []
+        for movie in favorite_movies:
+            if movie not in title_matches:
+                matched_movies = df[df['Title'].str.contains(movie, case=False)]
+                title_matches[movie] = None if matched_movies.empty else matched_movies.index[0]
+            if title_matches[movie] is not None:
+                movie_indices.append(title_matches[movie])
+        all_movie_indices.append(movie_indices)
+
+    # If there are favorite movies, find similar movies using KNN over all questions at once
+    recommendations = [[] for _ in questions]
+    flat_indices = [idx for movie_indices in all_movie_indices for idx in movie_indices]
+    if flat_indices:
+        distances, indices = knn.kneighbors(X[flat_indices])
+
         # Collect the recommended movie titles
-        for idx_list in indices:
-            for idx in idx_list:
-                recommendations.append(df.iloc[idx]['Title'])
-        
-        # Remove duplicates from the recommendations
-        recommendations = list(set(recommendations))
-        entities = ner_pipeline(', '.join(recommendations), aggregation_strategy="simple")
-
-        # Extract movie names (entities) from NER
-        recommendations = [entity['word'] for entity in entities]
-    
-    return ', '.join(recommendations)
+        offset = 0
+        for question_idx, movie_indices in enumerate(all_movie_indices):
+            for idx_list in indices[offset:offset + len(movie_indices)]:
+                for idx in idx_list:
+                    recommendations[question_idx].append(df.iloc[idx]['Title'])
+            offset += len(movie_indices)
+
+    # Remove duplicates from the recommendations and clean them with a second batched NER pass
+    pending = [i for i, titles in enumerate(recommendations) if titles]
+    if pending and budget is not None and budget.expired():
+        deadline.record("dropped_recommendation_candidates")
+        return [', '.join(list(dict.fromkeys(titles))[:max_degraded_recommendations]) for titles in recommendations]
+    if pending:
+        texts = [', '.join(list(set(recommendations[i]))) for i in pending]
+        for i, entities in zip(pending, ner_pipeline(texts, aggregation_strategy="simple", batch_size=batch_size)):
+            recommendations[i] = [entity['word'] for entity in entities]
+
+    return [', '.join(titles) for titles in recommendations]
+
+def recommendFromNeighbors(favorite_movies, n_recommendations=5):
+    """Merge the embedding neighbor lists of the favorite movies into one ranking."""
+    # Keep using this version of the neighbor lists if they are reloaded meanwhile
+    index = neighbor_index
+    film_labels, film_neighbors = index["labels"], index["neighbors"]
+
+    # Look up the films, exact title match first, then the first title containing the name
+    positions = []
+    for movie in favorite_movies:
+        position = index["positions"].get(movie.lower())
+        if position is None:
+            matched = film_labels[film_labels.str.contains(movie, case=False, regex=False)]
+            position = matched.index[0] if not matched.empty else None
+        if position is not None:
+            positions.append(position)
+
+    # Films close to several favorites, and close ranks, score higher
+    scores = Counter()
+    k = film_neighbors.shape[1]
+    for position in positions:
+        for rank, neighbor in enumerate(film_neighbors[position]):
+            scores[neighbor] += k - rank
+    for position in positions:
+        scores.pop(position, None)
 
+    return ', '.join(film_labels[neighbor] for neighbor, _ in scores.most_common(n_recommendations))
@@ -1,16 +1,15 @@
-from transformers import pipeline
 import requests
 import csv
 import pandas as pd
 import json
 import random
+from process_v3 import ner_pipeline  # Same NER model, loaded once
 
 
 # Load the CSV files into DataFrames for easy querying
 entities_df = pd.read_csv("./entities.csv")
 
 def handleMultiMedia(question):
-    ner_pipeline = pipeline('ner', model='dbmdz/bert-large-cased-finetuned-conll03-english')
     entities = ner_pipeline(question, aggregation_strategy="simple")
     person_names = [entity['word'] for entity in entities]
 
@@ -26,6 +25,32 @@ def handleMultiMedia(question):
     picture_link = get_random_image(imdb_ids)
     return picture_link
 
+def handleMultiMedias(questions, batch_size=16):
+    """Answer several multi-media questions with batched NER forward passes."""
+    all_entities = ner_pipeline(questions, aggregation_strategy="simple", batch_size=batch_size)
+
+    with open('./images.json', 'r') as file:
+        images_data = json.load(file)
+
+    # Each person name is only looked up once on Wikidata
+    imdb_id_cache = {}
+    results = []
+    for entities in all_entities:
+        person_names = [entity['word'] for entity in entities]
+        if not person_names:
+            results.append("No person name found in the question.")
+            continue
+
+        imdb_ids = []
+        for name in person_names:
+            if name not in imdb_id_cache:
+                imdb_id_cache[name] = get_imdb_id_from_wikidata(name)
+            if imdb_id_cache[name]:
+                imdb_ids.append(imdb_id_cache[name])
+
+        results.append(get_random_image(imdb_ids, images_data))
+    return results
+
 def get_imdb_id_from_wikidata(person_name):
     # SPARQL query to retrieve IMDb ID (P345) for the given person name
     query = f"""
@@ -54,9 +79,10 @@ def get_imdb_id_from_wikidata(person_name):
         return imdb_id
     return None
 
-def get_random_image(imdb_ids):
-    with open('./images.json', 'r') as file:
-        images_data = json.load(file)
+def get_random_image(imdb_ids, images_data=None):
+    if images_data is None:
+        with open('./images.json', 'r') as file:
+            images_data = json.load(file)
 
     # List to store possible image paths for matching IMDb IDs
     matching_images = []
@@ -1,31 +1,30 @@
 import pandas as pd
-from collections import Counter
-import numpy as np
+import crowd_analytics
+
+crowd_data_path = "./crowd_data.tsv"
 
 def handleCrowdSourcing(entity, relation):
-    # Load data
-    df = pd.read_csv("./crowd_data.tsv", sep="\t")
-    entities_df = pd.read_csv("entities.csv")  # Assuming entities.csv is loaded here
-    
     entity = entity.replace("http://www.wikidata.org/entity/", "wd:")
     relation = relation.replace("http://www.wikidata.org/prop/direct/", "wdt:")
 
-    # Filter malicious workers
-    filtered_data = filter_malicious_workers(df)
+    # Pick up rows appended to the crowd data since the last question, a replaced file is
+    # reloaded by the artifact manager
+    store = crowd_store
+    store.ingest_file(crowd_data_path)
 
-    # Filter tasks related to the entity and relation
-    relevant_data = filtered_data[(filtered_data["Input1ID"] == entity) & 
-                                  (filtered_data["Input2ID"] == relation)]
-    if relevant_data.empty:
+    # Look up the tasks related to the entity and relation
+    task = store.lookup(entity, relation)
+    if task is None:
         return None
     
     # Extract the answer from Input3ID
-    answer = relevant_data["Input3ID"].astype(str).unique()[0]
+    answer = task["answer"]
     
     # Check if answer starts with "wd:" and process accordingly
     if answer.startswith("wd:"):
         entity_id = answer.split(":")[1]  # Extract the part after "wd:"
-        entity_info = entities_df[entities_df["Entity URI"].str.contains(entity_id, na=False)]
+        names = entities_df
+        entity_info = names[names["Entity URI"].str.contains(entity_id, na=False)]
         
         if not entity_info.empty:
             # Replace with entity name from the entities.csv
@@ -33,11 +32,10 @@ def handleCrowdSourcing(entity, relation):
             answer = entity_name  # Replace the ID with the entity name
     
     # Aggregate answers
-    answers = relevant_data["AnswerLabel"].tolist()
-    majority_answer, answer_distribution = majority_voting(answers)
+    answer_distribution = f"{task['support']} support votes, {task['reject']} reject votes"
 
-    # Compute inter-rater agreement
-    kappa = compute_fleiss_kappa(answers)
+    # Inter-rater agreement of the batch the task belongs to
+    kappa = task["kappa"]
 
     # Format the response
     response = (
@@ -64,35 +62,26 @@ def filter_malicious_workers(data):
     return data[(data["LifetimeApprovalRate"] >= approval_threshold) & 
                 (data["WorkTimeInSeconds"] > min_work_time)]
 
-def majority_voting(answers):
-    """Aggregate answers using majority voting."""
-    # Count the number of CORRECT and INCORRECT votes
-    support_votes = answers.count("CORRECT")
-    reject_votes = answers.count("INCORRECT")
+def load_crowd_store(previous=None):
+    """Bring the crowd store up to date: tail an appended file, rebuild it if the file was replaced."""
+    if previous is not None and previous.ingest_file(crowd_data_path) is not None:
+        return previous
+    store = crowd_analytics.CrowdStore(filter_malicious_workers)
+    store.ingest_file(crowd_data_path)
+    return store
 
-    # Determine the majority answer (CORRECT or INCORRECT)
-    majority_answer = "CORRECT" if support_votes > reject_votes else "INCORRECT"
-    
-    # Prepare the answer distribution in the desired format
-    answer_distribution = f"{support_votes} support votes, {reject_votes} reject votes"
-    
-    return majority_answer, answer_distribution
+def register_artifacts(manager):
+    """Let the artifact manager reload the crowd data and entity names."""
+    def swap_store(value):
+        global crowd_store
+        crowd_store = value
+    def swap_entities(value):
+        global entities_df
+        entities_df = value
+    manager.register("crowd_data", [crowd_data_path], load_crowd_store, swap_store, crowd_store)
+    manager.register("crowd_entities", ["entities.csv"], lambda _: pd.read_csv("entities.csv"),
+                     swap_entities, entities_df)
 
-def compute_fleiss_kappa(votes):
-    """Compute Fleiss' kappa for inter-rater agreement with binary integer values (1 for CORRECT, 0 for INCORRECT)."""
-    # Map 'CORRECT' to 1 and 'INCORRECT' to 0 
-    votes = [1 if vote == 'CORRECT' else 0 for vote in votes]
-    category_counts = {0: votes.count(0), 1: votes.count(1)}
-    
-    n_raters = len(votes)   # Number of raters 
-    n_items = 1 # The number of tasks 
-    
-    total_count = sum(votes) 
-    p_o = total_count / n_raters  # Observed agreement (proportion of agreement)
-    
-    # Calculate the expected agreement (P_e)
-    p_e = sum((count / n_raters) ** 2 for count in category_counts.values())
-    
-    # Compute Fleiss' Kappa
-    kappa = (p_o - p_e) / (1 - p_e) if (1 - p_e) > 0 else 0
-    return round(kappa, 3)
+# Crowd answers are ingested incrementally, new rows are picked up on each question
+entities_df = pd.read_csv("entities.csv")
+crowd_store = load_crowd_store()
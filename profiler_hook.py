@@ -0,0 +1,186 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_SECONDS = 60         # Profiling window if the request names no limit
+SAMPLE_INTERVAL = 0.005      # Seconds between stack samples
+CONTROL_FILE = './profile.request'
+OUTPUT_DIR = './profiles'
+
+
+class ProfilerHook:
+    """
+    Attaches a deterministic profiler (cProfile) and a stack sampler to the serving loop on request,
+    for a number of seconds or messages, and writes the results per question type.
+    Profiling is requested with SIGUSR1 or by creating the control file, which may contain
+    "seconds=N" or "messages=N". While detached, each message only costs a flag check.
+    cProfile traces one message at a time (from Python 3.12 it is process-wide), messages
+    handled meanwhile on other threads are only sampled and timed.
+    """
+
+    def __init__(self, control_file=CONTROL_FILE, output_dir=OUTPUT_DIR):
+        self.control_file = control_file
+        self.output_dir = output_dir
+        self.active = False
+        self._detaching = False     # A finished window is still being written, no new window attaches meanwhile
+        self._requested = None
+        self._lock = threading.Lock()
+        self._tracing = threading.Lock()   # Held while a message is traced by cProfile
+        self._sampler = None
+        self._deadline = None
+        self._messages_left = None
+        self._stats = {}        # {question type: pstats.Stats}
+        self._stacks = {}       # {question type: Counter of collapsed stacks}
+        self._timings = {}      # {question type: [number of messages, total seconds]}
+        self._current_stacks = {}   # {thread id: Counter of the message being handled on that thread}
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.request(seconds=DEFAULT_SECONDS))
+
+    def request(self, seconds=None, messages=None):
+        """Ask for a profiling window, it starts with the next poll of the serving loop."""
+        self._requested = (seconds, messages)
+
+    def poll(self):
+        """Called by the serving loop: attach on request, detach when the window is over."""
+        if os.path.exists(self.control_file):
+            with open(self.control_file, 'r') as file:
+                options = dict(line.strip().split('=', 1) for line in file if '=' in line)
+            os.remove(self.control_file)
+            try:
+                seconds = float(options['seconds']) if 'seconds' in options else None
+                messages = int(options['messages']) if 'messages' in options else None
+            except ValueError:
+                print(f"Ignoring malformed profiling request {options}.")
+            else:
+                self.request(seconds=seconds, messages=messages)
+
+        if self._requested is not None and not self.active:
+            # A request arriving while the previous window is written waits for the next poll
+            seconds, messages = self._requested
+            if self._attach(seconds if seconds or messages else DEFAULT_SECONDS, messages):
+                self._requested = None
+        elif self._window_over():
+            self._detach()
+
+    def profile(self, handler, *args):
+        """Run handler(*args) -> (question type, result) and record it if profiling is active."""
+        if not self.active:
+            return handler(*args)
+
+        thread_id = threading.get_ident()
+        self._current_stacks[thread_id] = Counter()
+        profile = None
+        if self._tracing.acquire(blocking=False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiling tool is active, only sample this message
+                profile = None
+                self._tracing.release()
+        question_type = None
+        start = time.perf_counter()
+        try:
+            question_type, result = handler(*args)
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._tracing.release()
+            stacks = self._current_stacks.pop(thread_id)
+            self._record(str(question_type), profile, stacks, time.perf_counter() - start)
+        with self._lock:
+            if self._messages_left is not None:
+                self._messages_left -= 1
+        if self._window_over():
+            self._detach()
+        return question_type, result
+
+    def _window_over(self):
+        return self.active and ((self._deadline is not None and time.time() >= self._deadline)
+                or (self._messages_left is not None and self._messages_left <= 0))
+
+    def _attach(self, seconds, messages):
+        """Start a profiling window, returns False if a window is still active or being written."""
+        with self._lock:
+            if self.active or self._detaching:
+                return False
+            self._deadline = time.time() + seconds if seconds else None
+            self._messages_left = messages
+            self._stats, self._stacks, self._timings = {}, {}, {}
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self.active = True
+            self._sampler.start()
+        print(f"Profiling attached ({f'{seconds}s' if seconds else f'{messages} messages'}).")
+        return True
+
+    def _detach(self):
+        # The sampler and the tables of this window are taken under the lock and written outside it
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+            self._detaching = True
+            sampler, stats, stacks, timings = self._sampler, self._stats, self._stacks, self._timings
+        try:
+            sampler.join()
+            path = self._write(stats, stacks, timings)
+        finally:
+            with self._lock:
+                self._detaching = False
+        print(f"Profiling detached, results written to {path}.")
+
+    def _sample(self):
+        # Sample the stacks of the threads handling a message, attributed to that message
+        while self.active:
+            frames = sys._current_frames()
+            for thread_id, stacks in list(self._current_stacks.items()):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    stacks[';'.join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _record(self, question_type, profile, stacks, elapsed):
+        with self._lock:
+            if not self.active:
+                return
+            if profile is not None:
+                if question_type in self._stats:
+                    self._stats[question_type].add(profile)
+                else:
+                    self._stats[question_type] = pstats.Stats(profile)
+            self._stacks.setdefault(question_type, Counter()).update(stacks)
+            timing = self._timings.setdefault(question_type, [0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+
+    def _write(self, stats_by_type, stacks_by_type, timings):
+        path = os.path.join(self.output_dir, time.strftime("%Y%m%d-%H%M%S"))
+        os.makedirs(path, exist_ok=True)
+        for question_type, (messages, total) in timings.items():
+            # Collapsed stacks, one "frame;frame;frame count" line per stack (flame graph input)
+            with open(os.path.join(path, f"{question_type}.collapsed"), 'w') as file:
+                for stack, count in stacks_by_type[question_type].most_common():
+                    file.write(f"{stack} {count}\n")
+            # Cumulative timing table of the traced messages
+            stats = stats_by_type.get(question_type)
+            with open(os.path.join(path, f"{question_type}.txt"), 'w') as file:
+                file.write(f"{messages} messages, {total:.3f}s total, {total / messages:.3f}s per message\n")
+                if stats is not None:
+                    output = io.StringIO()
+                    stats.stream = output
+                    stats.sort_stats('cumulative').print_stats(50)
+                    file.write(output.getvalue())
+            if stats is not None:
+                stats.dump_stats(os.path.join(path, f"{question_type}.prof"))
+        return path
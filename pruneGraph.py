@@ -0,0 +1,52 @@
+import os
+import re
+import time
+import tracemalloc
+from rdflib import Graph, Namespace, RDFS
+
+# Namespaces
+WDT = Namespace('http://www.wikidata.org/prop/direct/')
+
+source_path = './14_graph.nt'
+serving_path = './14_graph_serving.nt'
+
+# The answer paths only read labels and the wdt: movie predicates (including P345, the IMDb ID)
+def keep_predicate(predicate):
+    return predicate == str(RDFS.label) or predicate.startswith(str(WDT))
+
+# Step 1: Filter the N-Triples line by line, the predicate is the second term of each line
+predicate_pattern = re.compile(r'^\S+\s+<([^>]*)>')
+total = kept = 0
+with open(source_path, 'r', encoding='utf-8') as source, open(serving_path, 'w', encoding='utf-8') as serving:
+    for line in source:
+        match = predicate_pattern.match(line)
+        if not match:
+            continue
+        total += 1
+        if keep_predicate(match.group(1)):
+            serving.write(line)
+            kept += 1
+
+# Step 2: Measure load time and memory of both graphs
+def measure(path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = Graph()
+    graph.parse(path, format='turtle')
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del graph
+    return elapsed, memory
+
+Graph().parse(data='', format='turtle')  # Load the parser plugins before measuring
+full_time, full_memory = measure(source_path)
+serving_time, serving_memory = measure(serving_path)
+
+mb = 1024 * 1024
+print(f"Serving graph written to {serving_path}.")
+print(f"Triples: {total} -> {kept} ({total - kept} removed)")
+print(f"File size: {os.path.getsize(source_path) / mb:.1f} MB -> {os.path.getsize(serving_path) / mb:.1f} MB")
+print(f"Graph memory: {full_memory / mb:.1f} MB -> {serving_memory / mb:.1f} MB "
+      f"({(full_memory - serving_memory) / mb:.1f} MB removed)")
+print(f"Load time: {full_time:.1f}s -> {serving_time:.1f}s")
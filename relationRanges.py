@@ -0,0 +1,31 @@
+import csv
+import numpy as np
+import rdflib
+from rdflib import Graph
+
+# Load the graph
+graph = Graph()
+graph.parse('./14_graph.nt', format='turtle')
+
+# Load the embedding dictionaries
+with open(r'./entity_ids.del', 'r', encoding='utf-8') as ifile:
+    ent2id = {rdflib.term.URIRef(ent): int(idx) for idx, ent in csv.reader(ifile, delimiter='\t')}
+with open(r'./relation_ids.del', 'r', encoding='utf-8') as ifile:
+    rel2id = {rdflib.term.URIRef(rel): int(idx) for idx, rel in csv.reader(ifile, delimiter='\t')}
+
+# Collect the entity IDs observed as objects of each relation
+ranges = [set() for _ in range(len(rel2id))]
+for _, predicate, obj in graph:
+    relation_id = rel2id.get(predicate)
+    entity_id = ent2id.get(obj)
+    if relation_id is not None and entity_id is not None:
+        ranges[relation_id].add(entity_id)
+
+# Store the ranges as one CSR layout: the range of relation r is indices[indptr[r]:indptr[r + 1]]
+indptr = np.zeros(len(ranges) + 1, dtype=np.int64)
+indptr[1:] = np.cumsum([len(entity_ids) for entity_ids in ranges])
+indices = np.concatenate([np.sort(np.fromiter(entity_ids, dtype=np.int32, count=len(entity_ids)))
+                          for entity_ids in ranges]) if ranges else np.zeros(0, dtype=np.int32)
+np.savez('./relation_ranges.npz', indptr=indptr, indices=indices)
+
+print(f"Ranges of {len(ranges)} relations ({len(indices)} entity IDs) have been written to relation_ranges.npz.")
@@ -0,0 +1,209 @@
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+
+DEFAULT_TIMEOUT = 10    # Wall-clock limit per query in seconds
+DEFAULT_MAX_ROWS = 100  # Result rows returned per query
+PLAN_CACHE_SIZE = 256   # Prepared queries kept per worker
+
+
+class QueryResult:
+    def __init__(self, rows, truncated, elapsed, cached):
+        self.rows = rows            # List of result rows, each a tuple of strings
+        self.truncated = truncated  # True if the query produced more than max_rows rows
+        self.elapsed = elapsed      # Execution time in seconds, measured in the worker
+        self.cached = cached        # True if the prepared query came from the plan cache
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ServiceRestarting(RuntimeError):
+    """Raised when no worker has finished loading the graph within the time limit."""
+
+
+def _serve(conn, graph_path, warm_queries):
+    """
+    Worker process: load the graph once and prepare the recently used queries, then execute
+    the queries sent over the pipe. A ("warm", queries) message prepares more queries, without a reply.
+    """
+    graph = Graph()
+    graph.parse(graph_path, format='turtle')
+    namespaces = dict(graph.namespaces())
+
+    @lru_cache(maxsize=PLAN_CACHE_SIZE)
+    def prepare(query):
+        return prepareQuery(query, initNs=namespaces)
+
+    def warm(queries):
+        for query in queries:
+            try:
+                prepare(query)
+            except Exception:
+                pass
+
+    warm(warm_queries)
+    conn.send(("ready", None))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message[0] == "warm":
+            warm(message[1])
+            continue
+        _, query, max_rows = message
+        try:
+            start = time.perf_counter()
+            hits = prepare.cache_info().hits
+            prepared = prepare(query)
+            cached = prepare.cache_info().hits > hits
+
+            result = graph.query(prepared)
+            if result.type == "ASK":
+                conn.send(("ok", ([(str(result.askAnswer),)], False, time.perf_counter() - start, cached)))
+                continue
+
+            rows = []
+            truncated = False
+            for row in result:
+                if len(rows) == max_rows:
+                    truncated = True
+                    break
+                rows.append(tuple(str(value) for value in row))
+            conn.send(("ok", (rows, truncated, time.perf_counter() - start, cached)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, graph_path, warm_queries):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_conn, graph_path, warm_queries),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        """True once the worker has loaded the graph, waits at most timeout seconds (None waits until it has)."""
+        if not self.ready and self.conn.poll(timeout):
+            status, _ = self.conn.recv()
+            self.ready = status == "ready"
+        return self.ready
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class SparqlService:
+    """
+    Runs SPARQL queries on a graph loaded in a separate worker process, so a runaway query
+    cannot block the serving thread. Queries past the time limit are cancelled by
+    terminating the worker. The new worker loads the graph in the background and prepares the
+    recently executed queries; until it is ready, queries fail with ServiceRestarting.
+    With standby=True, a second worker keeps the graph loaded and takes over at once, at the
+    cost of a second copy of the graph in memory.
+    """
+
+    def __init__(self, graph_path, timeout=DEFAULT_TIMEOUT, max_rows=DEFAULT_MAX_ROWS, standby=False):
+        self.graph_path = graph_path
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.standby = standby
+        self.stats = {"queries": 0, "timeouts": 0, "errors": 0, "cached": 0, "restarts": 0, "total_time": 0.0}
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()    # Recently executed queries, prepared by new workers while loading
+        self._worker = _Worker(graph_path, [])
+        self._standby = _Worker(graph_path, []) if standby else None
+
+    def wait_ready(self, timeout=None):
+        """Wait until the worker has loaded the graph, e.g. before serving the first query."""
+        with self._lock:
+            return self._worker.wait_ready(timeout)
+
+    def _restart_worker(self):
+        # A new worker loads in the background; with a standby, the standby takes over and the
+        # new worker becomes the standby
+        self.stats["restarts"] += 1
+        self._worker.stop()
+        warm_queries = list(self._recent)
+        if self._standby is not None:
+            self._worker = self._standby
+            try:
+                self._worker.conn.send(("warm", warm_queries))  # Queries executed since the standby started
+            except OSError:
+                pass    # The standby died, the next query restarts it
+            self._standby = _Worker(self.graph_path, warm_queries)
+        else:
+            self._worker = _Worker(self.graph_path, warm_queries)
+
+    def _ready_worker(self, timeout):
+        # Use whichever worker finished loading first
+        if not self._worker.wait_ready(0) and self._standby is not None and self._standby.wait_ready(0):
+            self._worker, self._standby = self._standby, self._worker
+        if not self._worker.wait_ready(timeout):
+            raise ServiceRestarting("The query service is restarting, please try again shortly.")
+        return self._worker
+
+    def execute(self, query, timeout=None, max_rows=None):
+        """
+        Execute a query in the worker and return a QueryResult. Raises TimeoutError past the time limit
+        and ServiceRestarting if no worker has loaded the graph within the time limit.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        max_rows = self.max_rows if max_rows is None else max_rows
+
+        with self._lock:
+            try:
+                worker = self._ready_worker(timeout)
+                worker.conn.send(("query", query, max_rows))
+                finished = worker.conn.poll(timeout)
+                status, payload = worker.conn.recv() if finished else (None, None)
+            except (EOFError, OSError):
+                # The worker was cancelled or died
+                self._restart_worker()
+                raise RuntimeError("Query was cancelled.")
+
+            self.stats["queries"] += 1
+            if not finished:
+                self.stats["timeouts"] += 1
+                self._restart_worker()
+                raise TimeoutError(f"Query exceeded the time limit of {timeout} seconds.")
+
+            if status == "ok":
+                self._recent[query] = None
+                self._recent.move_to_end(query)
+                if len(self._recent) > PLAN_CACHE_SIZE:
+                    self._recent.popitem(last=False)
+
+        if status == "error":
+            self.stats["errors"] += 1
+            raise RuntimeError(payload)
+
+        result = QueryResult(*payload)
+        self.stats["total_time"] += result.elapsed
+        self.stats["cached"] += int(result.cached)
+        return result
+
+    def cancel(self):
+        """Cancel the running query, if any, by terminating the worker."""
+        if self._worker.process.is_alive():
+            self._worker.process.terminate()
+
+    def close(self):
+        with self._lock:
+            self._worker.stop()
+            if self._standby is not None:
+                self._standby.stop()